@@ -1,5 +1,13 @@
-import yt_dlp
+import atexit
+import hashlib
+import json
 import os
+import sys
+import time
+from functools import lru_cache
+
+# O yt_dlp é importado só quando necessário (dentro das funções): carregar seus extractors
+# demora e atrasaria a abertura do programa.
 
 # --- Configuração Opcional ---
 # Se o FFmpeg não estiver no PATH do seu sistema, você pode especificar o caminho aqui.
@@ -7,8 +15,91 @@ import os
 # Exemplo no Linux/macOS: FFMPEG_PATH = "/usr/local/bin/ffmpeg"
 # Deixe como None para que o yt-dlp tente encontrar automaticamente.
 FFMPEG_PATH = "C:/ffmpeg/bin/ffmpeg.exe"
+
+# Cache em disco dos metadados dos vídeos, para que repetir a mesma URL seja instantâneo.
+# CACHE_TTL é a validade em segundos; use 0 para desativar o cache.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yt_dl_meta")
+CACHE_TTL = 3600
 # -----------------------------
 
+_ydl_instancias = {} # YoutubeDL reaproveitados entre buscas (criar um novo é caro e perde os caches internos)
+
+def obter_ydl(ydl_opts):
+    """Retorna uma instância de YoutubeDL reaproveitada para estas opções."""
+    chave = repr(sorted(ydl_opts.items()))
+    if chave not in _ydl_instancias:
+        import yt_dlp
+        _ydl_instancias[chave] = yt_dlp.YoutubeDL(ydl_opts)
+    return _ydl_instancias[chave]
+
+def fechar_ydl_instancias():
+    """Fecha as instâncias de YoutubeDL reaproveitadas (chamada automaticamente ao sair)."""
+    for ydl in _ydl_instancias.values():
+        try:
+            ydl.close()
+        except Exception:
+            pass # Encerrando: falhar ao fechar uma instância não deve impedir as outras
+    _ydl_instancias.clear()
+
+atexit.register(fechar_ydl_instancias)
+
+def cached_extract_info(url, ydl_opts, ttl=CACHE_TTL):
+    """
+    Retorna os metadados da URL (extract_info sem download).
+    Ordem de busca: memória (mesma sessão) -> cache em disco (se válido) -> yt-dlp.
+    O dict devolvido é o mesmo guardado na memória: trate-o como somente leitura.
+    """
+    url = url.strip().split("#", 1)[0]
+    opts_items = tuple(sorted(ydl_opts.items()))
+    if not ttl:
+        return _extrair_info(url, opts_items, ttl)[1]
+    obtido_em, info = _extrair_info_memo(url, opts_items, ttl)
+    if time.time() - obtido_em >= ttl:
+        # Expirou também na memória. O lru_cache não remove uma chave só; limpar tudo é barato,
+        # pois as demais URLs voltam do cache em disco (ainda válido) na próxima busca.
+        limpar_cache()
+        obtido_em, info = _extrair_info_memo(url, opts_items, ttl)
+    return info
+
+def _extrair_info(url, opts_items, ttl):
+    """
+    Metadados da URL, lidos do cache em disco ou extraídos pelo yt-dlp.
+    Retorna (momento em que foram obtidos, info), para o cache em memória respeitar o mesmo ttl.
+    """
+    chave = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    caminho_cache = os.path.join(CACHE_DIR, f"{chave}.json")
+    if ttl:
+        try:
+            mtime = os.path.getmtime(caminho_cache)
+            if time.time() - mtime < ttl:
+                with open(caminho_cache, "r", encoding="utf-8") as f:
+                    return mtime, json.load(f)
+        except (OSError, ValueError):
+            pass # Cache ausente ou corrompido: extrai novamente
+
+    ydl = obter_ydl(dict(opts_items))
+    info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+    obtido_em = time.time()
+
+    if ttl:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f"{caminho_cache}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False)
+            os.replace(tmp, caminho_cache) # Escrita atômica
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache de metadados: {e}")
+    return obtido_em, info
+
+# Mesma função com cache em memória: repetir a URL na mesma sessão (outro formato, nova tentativa)
+# não lê nem o disco. Erros não são guardados, então uma nova tentativa após falha busca de novo.
+_extrair_info_memo = lru_cache(maxsize=128)(_extrair_info)
+
+def limpar_cache():
+    """Descarta os metadados guardados em memória (o cache em disco continua valendo até o CACHE_TTL)."""
+    _extrair_info_memo.cache_clear()
+
 def solicitar_url():
     """Solicita a URL do vídeo ao usuário."""
     while True:
@@ -16,7 +107,7 @@ def solicitar_url():
         if not url:
             return None
         # Validação muito básica de URL
-        if url.startswith("http://") or url.startswith("https://"):
+        if url.startswith(("http://", "https://")):
             return url
         else:
             print("URL inválida. Por favor, insira uma URL completa (começando com http ou https).")
@@ -43,31 +134,11 @@ def solicitar_pasta_destino():
 
 def listar_e_escolher_formato(url):
     """
-    Busca os formatos disponíveis para a URL, apresenta opções ao usuário
-    e retorna o ID do formato escolhido e se é para converter para MP3.
+    Apresenta as opções de formato ao usuário e retorna o ID do formato escolhido
+    e se é para converter para MP3. Os formatos disponíveis só são buscados na opção 5
+    (as demais usam seletores que o yt-dlp resolve durante o download).
     Retorna uma tupla (formato_string, converter_para_mp3_flag) ou None em caso de erro.
     """
-    print("\nBuscando formatos disponíveis... Isso pode levar um momento.")
-    ydl_opts_info = {'quiet': True, 'no_warnings': True}
-    if FFMPEG_PATH:
-        ydl_opts_info['ffmpeg_location'] = FFMPEG_PATH
-
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info_dict = ydl.extract_info(url, download=False) # Não baixa, apenas pega informações
-            formats = info_dict.get('formats', [])
-    except yt_dlp.utils.DownloadError as e:
-        print(f"Erro ao buscar informações do vídeo: {e}")
-        print("Verifique a URL ou sua conexão com a internet. A plataforma pode não ser suportada ou o vídeo pode ser privado/restrito.")
-        return None, False
-    except Exception as e:
-        print(f"Erro inesperado ao buscar formatos: {e}")
-        return None, False
-
-    if not formats:
-        print("Nenhum formato de vídeo/áudio encontrado para esta URL.")
-        return None, False
-
     print("\n--- Opções de Qualidade/Formato ---")
     print("1. Melhor qualidade geral (vídeo+áudio, pode precisar de FFmpeg para mesclar)")
     print("2. Melhor qualidade em MP4 (vídeo+áudio, pode precisar de FFmpeg para mesclar)")
@@ -93,36 +164,39 @@ def listar_e_escolher_formato(url):
         else:
             print("Opção inválida. Tente novamente.")
 
+    print("\nBuscando formatos disponíveis... Isso pode levar um momento.")
+    import yt_dlp
+    ydl_opts_info = {'quiet': True, 'no_warnings': True}
+    if FFMPEG_PATH:
+        ydl_opts_info['ffmpeg_location'] = FFMPEG_PATH
+
+    try:
+        info_dict = cached_extract_info(url, ydl_opts_info) # Não baixa, apenas pega informações
+        formats = info_dict.get('formats', [])
+    except yt_dlp.utils.DownloadError as e:
+        print(f"Erro ao buscar informações do vídeo: {e}")
+        print("Verifique a URL ou sua conexão com a internet. A plataforma pode não ser suportada ou o vídeo pode ser privado/restrito.")
+        return None, False
+    except Exception as e:
+        print(f"Erro inesperado ao buscar formatos: {e}")
+        return None, False
+
+    if not formats:
+        print("Nenhum formato de vídeo/áudio encontrado para esta URL.")
+        return None, False
+
     # Listagem detalhada para a opção '5'
     print("\n--- Formatos Disponíveis Detalhados ---")
-    formatos_display = []
-    for f in formats:
-        # Ignora formatos que são apenas metadados ou thumbnails
-        if not f.get('vcodec', 'none') == 'none' or not f.get('acodec', 'none') == 'none':
-            formatos_display.append(f)
-    
+    # Ignora formatos que são apenas metadados ou thumbnails
+    formatos_display = [f for f in formats if f.get('vcodec', 'none') != 'none' or f.get('acodec', 'none') != 'none']
+
     if not formatos_display:
         print("Nenhum formato de vídeo/áudio detalhado encontrado.")
         return 'bestvideo+bestaudio/best', False # Fallback
 
-    for i, f in enumerate(formatos_display):
-        res = f.get('resolution', 'Áudio')
-        ext = f.get('ext', 'N/A')
-        vcodec = f.get('vcodec', 'none')
-        acodec = f.get('acodec', 'none')
-        format_note = f.get('format_note', '')
-        filesize_approx = f.get('filesize') or f.get('filesize_approx') # 'filesize' é mais preciso se disponível
-        filesize_str = f"{filesize_approx / (1024 * 1024):.2f} MB" if filesize_approx else "Desconhecido"
-        
-        tipo = ""
-        if vcodec != 'none' and acodec != 'none':
-            tipo = "Vídeo+Áudio"
-        elif vcodec != 'none':
-            tipo = "Vídeo Apenas"
-        elif acodec != 'none':
-            tipo = "Áudio Apenas"
-
-        print(f"ID: {f['format_id']:<10} | Tipo: {tipo:<13} | Ext: {ext:<5} | Res: {res:<12} | Tamanho: {filesize_str:<15} | Nota: {format_note}")
+    # Monta a listagem inteira e escreve de uma vez (um único write em vez de um print por formato)
+    linhas = [formatar_linha_formato(f) for f in formatos_display]
+    sys.stdout.write("\n".join(linhas) + "\n")
 
     while True:
         id_escolhido = input("Digite o ID do formato desejado (ex: '137+140' para vídeo e áudio separados, ou '22' para um formato combinado) ou 'c' para cancelar e usar o padrão: ").strip()
@@ -138,6 +212,27 @@ def listar_e_escolher_formato(url):
             print("ID inválido. Por favor, tente novamente.")
 
 
+def formatar_linha_formato(f):
+    """Formata uma linha da listagem detalhada de formatos."""
+    res = f.get('resolution', 'Áudio')
+    ext = f.get('ext', 'N/A')
+    vcodec = f.get('vcodec', 'none')
+    acodec = f.get('acodec', 'none')
+    format_note = f.get('format_note', '')
+    filesize_approx = f.get('filesize') or f.get('filesize_approx') # 'filesize' é mais preciso se disponível
+    filesize_str = f"{filesize_approx / (1024 * 1024):.2f} MB" if filesize_approx else "Desconhecido"
+
+    tipo = ""
+    if vcodec != 'none' and acodec != 'none':
+        tipo = "Vídeo+Áudio"
+    elif vcodec != 'none':
+        tipo = "Vídeo Apenas"
+    elif acodec != 'none':
+        tipo = "Áudio Apenas"
+
+    return f"ID: {f['format_id']:<10} | Tipo: {tipo:<13} | Ext: {ext:<5} | Res: {res:<12} | Tamanho: {filesize_str:<15} | Nota: {format_note}"
+
+
 def baixar_video(url, formato_id, pasta_destino, converter_para_mp3=False):
     """Baixa o vídeo com as opções especificadas."""
     
@@ -163,19 +258,26 @@ def baixar_video(url, formato_id, pasta_destino, converter_para_mp3=False):
             'preferredcodec': 'mp3',
             'preferredquality': '192', # Qualidade do MP3 em kbps
         }]
+        # Sem linha de status por frame (-nostats) e usando todos os núcleos na conversão
+        ydl_opts['postprocessor_args'] = {
+            'extractaudio': ['-threads', str(os.cpu_count() or 1), '-nostats', '-loglevel', 'error'],
+        }
         # Se estamos extraindo áudio, não precisamos de merge_output_format para vídeo
         # E o formato deve ser apenas de áudio
-        ydl_opts['format'] = 'bestaudio/best' if formato_id != 'bestaudio/best' and not 'audio' in formato_id.lower() else formato_id
+        formato_lower = formato_id.lower()
+        ydl_opts['format'] = 'bestaudio/best' if formato_lower != 'bestaudio/best' and 'audio' not in formato_lower else formato_id
         print("Configurado para baixar e converter para MP3.")
     elif formato_id and ('bestvideo' in formato_id or '+' in formato_id): # Formatos que podem precisar de mesclagem
         ydl_opts['merge_output_format'] = 'mp4' # Tenta mesclar em MP4 por padrão
+        ydl_opts['postprocessor_args'] = {'merger': ['-nostats', '-loglevel', 'error']}
         print(f"Formato selecionado ('{formato_id}') pode requerer mesclagem com FFmpeg.")
 
 
     print(f"\nIniciando download de: {url}")
     print(f"Formato: {formato_id}{' (convertendo para MP3)' if converter_para_mp3 else ''}")
     print(f"Salvando em: {pasta_destino}")
-    
+
+    import yt_dlp
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             ydl.download([url])
@@ -3,11 +3,13 @@ Atualização do seu downloader (yt.py) — versão mais robusta.
 Recursos adicionados:
  - Suporte a playlists (YouTube e outros provedores suportados pelo yt-dlp)
  - Filtros aplicáveis a playlists: duração mínima/máxima, intervalo de data, título contém (substring/regex)
- - Evitar duplicatas: checagem por ID e por arquivo existente + banco local (JSON)
+ - Evitar duplicatas: checagem por ID e por arquivo existente + banco local (sqlite)
  - Modo interativo e modo comando (CLI) com argparse
  - Opção para preservar o nome (sem adicionar [id]) ou incluir id para garantir unicidade
  - Suporte a conversão MP3, mesclagem com ffmpeg, resume automático
- - Registro (logging) e arquivo de histórico (downloaded_ids.json)
+ - Conversão MP3 em processos separados (ProcessPoolExecutor), em paralelo com o próximo download
+ - Registro (logging) e arquivo de histórico (downloaded_ids.sqlite3, sqlite em modo WAL)
+ - Cache em disco dos metadados (extract_info) com TTL configurável (~/.cache/yt_dl_meta)
  - Paralelismo configurável (ThreadPoolExecutor) - cuidado com limites do provedor
  - Retry simples para downloads com backoff
  - Hooks de progresso com logs limpos
@@ -20,40 +22,137 @@ OBSERVAÇÕES:
 """
 
 import argparse
+import atexit
+import hashlib
 import json
 import logging
+import logging.handlers
+import multiprocessing as mp
 import os
+import queue
+import random
 import re
+import shutil
+import signal
+import sqlite3
+import subprocess
 import sys
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from pathlib import Path
 
-import yt_dlp
+# yt_dlp e concurrent.futures são importados dentro das funções que os usam: o registro de
+# extractors do yt-dlp leva centenas de ms para carregar, e --help, o prompt interativo e os
+# processos de conversão MP3 não precisam dele.
+
+try:
+    import orjson  # opcional (pip install orjson): JSON em C, bem mais rápido para os dicts do cache
+except ImportError:
+    orjson = None
 
 # Configuração padrão
 FFMPEG_PATH = "C:/ffmpeg/bin/ffmpeg.exe"  # Ajuste ou deixe como None
-DB_FILENAME = "downloaded_ids.json"
+DB_FILENAME = "downloaded_ids.sqlite3"
+LEGACY_DB_FILENAME = "downloaded_ids.json"  # formato antigo, importado para o sqlite na primeira execução
 LOG_FILENAME = "yt_downloader.log"
 DEFAULT_DEST = os.path.join(os.getcwd(), "downloads_videos")
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yt_dl_meta")
+CACHE_TTL = 3600  # segundos; 0 desativa o cache de metadados
+FFMPEG_QUIET_ARGS = ["-nostats", "-loglevel", "error"]
+
+# Progresso: os hooks do yt-dlp (chamados centenas de vezes por download, em várias threads)
+# só enfileiram; uma única thread consome a fila e desenha o terminal.
+progress_q = queue.Queue(maxsize=1000)
+_progress_thread = None
+
+
+class ProgressBoard:
+    # Uma linha de terminal por download ativo, redesenhada com códigos ANSI.
+    # Desativado quando a saída não é um terminal (ex.: redirecionada para arquivo).
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.enabled = stream.isatty()
+        self.lines = {}
+        self.drawn = 0
+        self.lock = threading.RLock()
+
+    def update(self, key, text):
+        with self.lock:
+            if text is None:
+                self.lines.pop(key, None)
+            else:
+                self.lines[key] = text
+            self.clear()
+            self.redraw()
+
+    def clear(self):
+        # sobe até a primeira linha do quadro e apaga dali até o fim da tela
+        if self.enabled and self.drawn:
+            self.stream.write(f"\x1b[{self.drawn}F\x1b[J")
+            self.drawn = 0
+
+    def redraw(self):
+        if self.enabled and self.lines:
+            width = max(20, shutil.get_terminal_size().columns - 1)  # sem quebra de linha, para a contagem bater
+            self.stream.write("".join(f"\x1b[2K{text[:width]}\n" for text in self.lines.values()))
+            self.drawn = len(self.lines)
+            self.stream.flush()
+
+
+class ProgressAwareStreamHandler(logging.StreamHandler):
+    # Apaga o quadro de progresso antes de escrever o log e o redesenha logo abaixo
+    def emit(self, record):
+        with progress_board.lock:
+            progress_board.clear()
+            super().emit(record)
+            progress_board.redraw()
+
+
+progress_board = ProgressBoard(sys.stdout)
 
 # Logger
+# As threads de download só enfileiram os registros (QueueHandler); a escrita em arquivo/console
+# acontece numa thread própria (QueueListener), sem travar os downloads em disco lento (SD/Termux).
 logger = logging.getLogger("yt_downloader")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler(LOG_FILENAME, encoding="utf-8")
+fh = logging.handlers.RotatingFileHandler(LOG_FILENAME, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8", delay=True)
 fh.setLevel(logging.DEBUG)
-ch = logging.StreamHandler(sys.stdout)
+ch = ProgressAwareStreamHandler(sys.stdout)
 ch.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+formatter = logging.Formatter("{asctime} [{levelname}] {message}", "%Y-%m-%d %H:%M:%S", style="{")
 fh.setFormatter(formatter)
 ch.setFormatter(formatter)
-logger.addHandler(fh)
-logger.addHandler(ch)
+log_q = queue.Queue()
+logger.addHandler(logging.handlers.QueueHandler(log_q))
+log_listener = logging.handlers.QueueListener(log_q, fh, ch, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)  # esvazia a fila de logs antes de sair
+
+
+class YdlLogger:
+    # Passado como 'logger' ao yt-dlp: a saída dele (to_screen) não vai direto ao stdout a partir das
+    # threads de download, o que atravessaria o quadro de progresso. Mensagens de tela só vão ao arquivo.
+    def debug(self, msg):
+        logger.debug(msg)
+
+    def info(self, msg):
+        logger.debug(msg)
+
+    def warning(self, msg):
+        logger.warning(msg)
+
+    def error(self, msg):
+        logger.error(msg)
+
 
-# Lock para acesso ao DB compartilhado
-db_lock = threading.Lock()
+ydl_logger = YdlLogger()
+
+# "Título [id].ext": captura o conteúdo entre colchetes nos nomes dos arquivos
+BRACKET_ID_RE = re.compile(r"\[([^\[\]]+)\]")
+
+# Sinaliza encerramento (Ctrl+C) para as threads: interrompe esperas de retry e downloads em andamento
+shutdown_evt = threading.Event()
 
 
 # ----------------- Utilitários -----------------
@@ -62,25 +161,70 @@ def ensure_folder(folder_path: str):
     os.makedirs(folder_path, exist_ok=True)
 
 
-def load_db(db_path: str):
-    if os.path.exists(db_path):
+def json_dumps_bytes(data) -> bytes:
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def json_loads(raw: bytes):
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+def write_json_atomic(path: str, data):
+    # grava em arquivo temporário e substitui atomicamente (nunca deixa JSON pela metade)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(json_dumps_bytes(data))
+    os.replace(tmp, path)
+
+
+class DownloadDB:
+    # Histórico de ids baixados em sqlite (WAL). Cada add() é um INSERT de uma linha, em vez de
+    # reescrever o arquivo inteiro; o sqlite cuida da concorrência entre as threads de download.
+
+    def __init__(self, db_path: str, legacy_path: str = None):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS downloaded(id TEXT PRIMARY KEY, ts INTEGER)")
+        if legacy_path and os.path.exists(legacy_path):
+            self.migrate_legacy(legacy_path)
+
+    def migrate_legacy(self, legacy_path: str):
+        # Importa o downloaded_ids.json antigo uma única vez (numa só transação) e o renomeia,
+        # para que o JSON inteiro não seja relido a cada execução.
         try:
-            with open(db_path, "r", encoding="utf-8") as f:
-                return set(json.load(f))
+            with open(legacy_path, "rb") as f:
+                ids = json_loads(f.read())
         except Exception as e:
-            logger.warning(f"Falha ao ler DB '{db_path}': {e}. Recriando DB vazio.")
-            return set()
-    return set()
-
+            logger.warning(f"Falha ao ler DB antigo '{legacy_path}': {e}. Ignorando.")
+            return
+        now = int(time.time())
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR IGNORE INTO downloaded(id, ts) VALUES (?, ?)", ((i, now) for i in ids))
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.conn.execute("ROLLBACK")
+            logger.error(f"Erro migrando DB antigo '{legacy_path}': {e}")
+            return
+        os.replace(legacy_path, legacy_path + ".migrated")
+        logger.info(f"{len(ids)} ids migrados de '{legacy_path}' para '{self.db_path}'.")
+
+    def load(self):
+        return {row[0] for row in self.conn.execute("SELECT id FROM downloaded")}
+
+    def add(self, entry_id: str):
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO downloaded(id, ts) VALUES (?, ?)", (entry_id, int(time.time())))
+        except sqlite3.Error as e:
+            logger.error(f"Erro salvando DB: {e}")
 
-def save_db(db_path: str, id_set: set):
-    tmp = db_path + ".tmp"
-    try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(list(id_set), f, ensure_ascii=False, indent=2)
-        os.replace(tmp, db_path)
-    except Exception as e:
-        logger.error(f"Erro salvando DB: {e}")
+    def close(self):
+        # idempotente: chamado no fim da playlist e de novo pelo atexit
+        self.conn.close()
 
 
 def parse_date_YYYYMMDD(s: str):
@@ -114,9 +258,100 @@ def parse_duration_to_seconds(s: str):
     raise argparse.ArgumentTypeError(f"Formato de duração inválido: {s}")
 
 
+# --------------- Pool de YoutubeDL ----------------
+
+# Criar um YoutubeDL é caro (opções, cookies, extractors) e descarta os caches internos dos
+# extractors (ex.: player JS do YouTube já decifrado). Reaproveitamos uma instância por conjunto
+# de opções. YoutubeDL não é thread-safe, por isso o pool é separado por thread.
+_ydl_local = threading.local()
+_ydl_instances = []
+_ydl_instances_lock = threading.Lock()
+
+
+def _opts_key(opts):
+    # valores não-hasheáveis (listas de hooks, dicts de postprocessors) entram como string
+    return frozenset(
+        (k, v if isinstance(v, (str, int, float, bool, type(None))) else repr(v))
+        for k, v in opts.items()
+    )
+
+
+def get_ydl(opts):
+    pool = getattr(_ydl_local, "pool", None)
+    if pool is None:
+        pool = _ydl_local.pool = {}
+    key = _opts_key(opts)
+    ydl = pool.get(key)
+    if ydl is None:
+        import yt_dlp  # import tardio (veja o topo do arquivo)
+
+        # os progress_hooks são registrados uma vez, na construção; reusar não os duplica
+        ydl = pool[key] = yt_dlp.YoutubeDL(opts)
+        with _ydl_instances_lock:
+            _ydl_instances.append(ydl)
+    return ydl
+
+
+def close_ydl_pool():
+    with _ydl_instances_lock:
+        for ydl in _ydl_instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.debug(f"Erro fechando YoutubeDL: {e}")
+        _ydl_instances.clear()
+
+
+atexit.register(close_ydl_pool)
+
+
+# --------------- Cache de metadados ----------------
+
+def cache_path_for(url: str, variant: str = ""):
+    # chave = sha1 da URL canônica (já inclui o id da playlist, ex: &list=...) + variante das opções
+    canonical = url.strip().split("#", 1)[0]
+    key = hashlib.sha1(f"{canonical}|{variant}".encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def cached_extract_info(url, ydl_opts, ttl=CACHE_TTL, refresh=False, **extract_kwargs):
+    # extract_info(download=False) com cache em disco; ttl=0 desativa, refresh=True ignora o cache existente
+    variant = json.dumps({"extract_flat": ydl_opts.get("extract_flat"), **extract_kwargs}, sort_keys=True)
+    path = cache_path_for(url, variant)
+    if ttl and not refresh:
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime < ttl:
+                with open(path, "rb") as f:
+                    info = json_loads(f.read())
+                logger.debug("Metadados lidos do cache: %s", url)  # formatado só se algum handler aceitar DEBUG
+                return info
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Cache de metadados inválido para {url}: {e}. Extraindo novamente.")
+
+    ydl = get_ydl(ydl_opts)
+    info = ydl.sanitize_info(ydl.extract_info(url, download=False, **extract_kwargs))
+
+    if ttl:
+        try:
+            ensure_folder(CACHE_DIR)
+            write_json_atomic(path, info)
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o cache de metadados: {e}")
+    return info
+
+
+def clear_metadata_cache():
+    # --clear-cache: descarta todo o cache de metadados em disco
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    logger.info(f"Cache de metadados removido: {CACHE_DIR}")
+
+
 # --------------- Downloader core ----------------
 
-def build_ydl_opts(outtmpl, format_id, ffmpeg_path=None, convert_mp3=False, quiet=False, continuedl=True):
+def build_ydl_opts(outtmpl, format_id, ffmpeg_path=None, convert_mp3=False, quiet=False, continuedl=True, post_hooks=None):
     opts = {
         "format": format_id or "best",
         "outtmpl": outtmpl,
@@ -124,57 +359,192 @@ def build_ydl_opts(outtmpl, format_id, ffmpeg_path=None, convert_mp3=False, quie
         "nocheckcertificate": True,
         "continuedl": continuedl,
         "progress_hooks": [progress_hook],
+        "noprogress": True,  # o progresso é desenhado pela thread de progresso (progress_printer)
         "quiet": quiet,
+        "logger": ydl_logger,
     }
     if ffmpeg_path:
         opts["ffmpeg_location"] = ffmpeg_path
+    # -nostats/-loglevel error: o ffmpeg não gera (e o yt-dlp não precisa ler) uma linha de status por frame
+    opts["postprocessor_args"] = {"merger": FFMPEG_QUIET_ARGS}
     if convert_mp3:
-        opts["postprocessors"] = [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192",
-        }]
+        # A conversão para MP3 não roda mais dentro do yt-dlp (FFmpegExtractAudio): o arquivo
+        # baixado é entregue via post_hooks para o pool de conversão e o próximo download já começa.
         opts["format"] = "bestaudio/best"
+    if post_hooks:
+        opts["post_hooks"] = list(post_hooks)
     return opts
 
 
+def resolve_ffmpeg_binary(ffmpeg_path=None):
+    # FFMPEG_PATH pode apontar para o executável ou para a pasta bin/ (como no yt-dlp)
+    if ffmpeg_path and os.path.isdir(ffmpeg_path):
+        return os.path.join(ffmpeg_path, "ffmpeg")
+    if ffmpeg_path and os.path.exists(ffmpeg_path):
+        return ffmpeg_path
+    return "ffmpeg"
+
+
+def convert_to_mp3(src, dst, ffmpeg_bin="ffmpeg", bitrate="192k", threads=1):
+    # Executado em um processo do ProcessPoolExecutor. Grava em .part e só então substitui,
+    # para que uma conversão interrompida não pareça um MP3 válido.
+    if shutdown_evt.is_set():
+        # Ctrl+C já chegou a este processo (install_sigint_handler é o initializer do pool): conversões
+        # que o executor já tinha repassado ao processo não podem mais ser canceladas, então falham aqui
+        raise RuntimeError("conversão cancelada: interrompido pelo usuário")
+    tmp = dst + ".part"
+    # -threads depois do -i: opção de saída (codificação), não do decodificador
+    cmd = [ffmpeg_bin, *FFMPEG_QUIET_ARGS, "-y", "-i", src, "-vn", "-threads", str(threads), "-b:a", bitrate, "-f", "mp3", tmp]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        err = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(f"ffmpeg falhou ({result.returncode}): {err[-1] if err else 'sem saída'}")
+    os.replace(tmp, dst)
+    os.remove(src)  # equivalente ao keepvideo=False do FFmpegExtractAudio
+    return dst
+
+
+# Conversão enfileirada pelo post_hook na thread de download atual; o worker a recolhe depois do
+# download para só registrar o id no DB quando o MP3 existir de fato.
+_conversion_local = threading.local()
+
+
+def make_mp3_post_hook(encode_exe, encode_futures, ffmpeg_bin, threads=1):
+    # post_hook do yt-dlp: recebe o caminho final do arquivo baixado e enfileira a conversão.
+    # Roda na própria thread do download (o yt-dlp chama os post_hooks de forma síncrona).
+    def hook(filepath):
+        if filepath.lower().endswith(".mp3"):
+            return
+        dst = os.path.splitext(filepath)[0] + ".mp3"
+        logger.info(f"Conversão para MP3 enfileirada: {os.path.basename(dst)}")
+        fut = encode_exe.submit(convert_to_mp3, filepath, dst, ffmpeg_bin, threads=threads)
+        encode_futures[fut] = filepath
+        _conversion_local.future = fut
+    return hook
+
+
+def pop_queued_conversion():
+    fut = getattr(_conversion_local, "future", None)
+    _conversion_local.future = None
+    return fut
+
+
+def wait_for_conversions(encode_futures):
+    from concurrent.futures import as_completed
+
+    for fut in as_completed(encode_futures):
+        src = encode_futures[fut]
+        try:
+            logger.info(f"Convertido para MP3: {fut.result()}")
+        except Exception as e:
+            logger.error(f"Falha ao converter {src} para MP3 (arquivo original mantido): {e}")
+
+
 def progress_hook(d):
+    if shutdown_evt.is_set():
+        import yt_dlp
+
+        # abortar o download em andamento; o yt-dlp propaga a exceção até download_with_retries
+        raise yt_dlp.utils.DownloadCancelled("Interrompido pelo usuário")
     status = d.get("status")
     if status == "downloading":
-        p = d.get("_percent_str", "0.0%")
-        speed = d.get("speed_str", "N/A")
-        eta = d.get("eta", "N/A")
-        filename = os.path.basename(d.get("filename") or d.get("info_dict", {}).get("_filename", ""))
-        print(f"\rBaixando {filename}: {p} @ {speed} (ETA: {eta})", end="")
-    elif status == "finished":
+        try:
+            progress_q.put_nowait(d)
+        except queue.Full:
+            pass  # atualizações de progresso são só informativas; descartar excedentes é ok
+        return
+    # finished/error sempre chegam à thread de progresso, para remover a linha do download
+    progress_q.put(d)
+    if status == "finished":
         filename = d.get("filename") or d.get("info_dict", {}).get("_filename")
         logger.info(f"Download concluído: {filename}")
     elif status == "error":
         logger.error("Erro no hook de progresso: %s", d)
 
 
-def should_skip_entry(entry, filters, downloaded_ids, dest, preserve_filename):
+def compile_title_filter(match_title, match_regex=False):
+    # Prepara --match-title uma vez por playlist (fora do loop de entradas)
+    if not match_title:
+        return None
+    if match_regex:
+        try:
+            return re.compile(match_title, re.IGNORECASE)
+        except re.error:
+            logger.warning("Regex inválido fornecido para --match-title; ignorando regex e usando substring.")
+    return match_title.lower()
+
+
+def index_existing_files(dest, only_ext=None):
+    # Lista a pasta destino uma única vez: ids entre colchetes ("Título [id].ext") e nomes dos arquivos.
+    # os.scandir expõe is_file() a partir dos dados do diretório, sem um stat() extra por arquivo.
+    # only_ext (ex.: ".mp3") ignora os demais arquivos, como o áudio original de uma conversão que falhou.
+    try:
+        with os.scandir(dest) as it:
+            names_on_disk = [e.name for e in it if e.is_file() and (not only_ext or e.name.lower().endswith(only_ext))]
+    except FileNotFoundError:
+        names_on_disk = []
+    ids_on_disk = {m for name in names_on_disk for m in BRACKET_ID_RE.findall(name)}
+    return ids_on_disk, names_on_disk
+
+
+def progress_printer():
+    # Único consumidor de progress_q (thread daemon)
+    while True:
+        d = progress_q.get()
+        try:
+            info = d.get("info_dict") or {}
+            filename = os.path.basename(d.get("filename") or info.get("_filename", ""))
+            # uma linha por vídeo: o worker conhece o id (para removê-la), não o nome do arquivo
+            key = info.get("id") or filename
+            if d.get("status") == "downloading":
+                p = d.get("_percent_str", "0.0%")
+                speed = d.get("speed_str", "N/A")
+                eta = d.get("eta", "N/A")
+                progress_board.update(key, f"Baixando {filename}: {p} @ {speed} (ETA: {eta})")
+            else:
+                progress_board.update(key, None)
+        except Exception as e:
+            logger.debug(f"Erro exibindo progresso: {e}")
+
+
+def clear_progress_row(video_id):
+    # O yt-dlp não emite status 'error': um download que falha ou é cancelado só levanta a exceção,
+    # então o worker remove a linha dele explicitamente para ela não ficar presa no quadro.
+    progress_q.put({"status": "removed", "info_dict": {"id": video_id}})
+
+
+def start_progress_printer():
+    global _progress_thread
+    if _progress_thread is None:
+        if progress_board.enabled and os.name == "nt":
+            os.system("")  # habilita sequências ANSI no console do Windows
+        _progress_thread = threading.Thread(target=progress_printer, name="progress-printer", daemon=True)
+        _progress_thread.start()
+
+
+def should_skip_entry(entry, filters, downloaded_ids, ids_on_disk, names_on_disk, preserve_filename):
     # entry é um dict do yt-dlp com keys como 'id', 'duration', 'upload_date', 'title'
+    # ids_on_disk/names_on_disk vêm de index_existing_files(), calculados uma vez por playlist
     vid = entry.get("id")
     if not vid:
         return False, "sem-id"
+    # antes de qualquer checagem de arquivo: re-sincronizar uma playlist vira só lookups no set
     if filters.get("skip_downloaded") and vid in downloaded_ids:
         return True, "id no DB"
 
     # Checa arquivo existente
     if not preserve_filename:
-        # buscamos por [id] no diretório
-        pattern = f"*[{vid}]*"
-        matches = list(Path(dest).glob(f"*{vid}*"))
-        if matches:
+        # buscamos por [id] nos arquivos da pasta
+        if vid in ids_on_disk:
             return True, "arquivo existente com id"
     else:
         # se preserva nome, checar por title.ext (pode colidir)
         title = entry.get("title", "")
         # simplificação: checar algum arquivo que contenha o título (não 100% confiável)
-        for p in Path(dest).iterdir():
-            if p.is_file() and title and title in p.name:
-                return True, "arquivo existente por título"
+        if title and any(title in name for name in names_on_disk):
+            return True, "arquivo existente por título"
 
     dur = entry.get("duration")
     if filters.get("min_duration") and dur is not None and dur < filters["min_duration"]:
@@ -188,20 +558,15 @@ def should_skip_entry(entry, filters, downloaded_ids, dest, preserve_filename):
     if filters.get("date_to") and upload_date and upload_date > filters["date_to"]:
         return True, "upload_date depois do limite"
 
-    title = entry.get("title", "")
+    # match_title vem de compile_title_filter(): regex já compilado ou substring já em minúsculas
     match_title = filters.get("match_title")
     if match_title:
-        if filters.get("match_regex"):
-            try:
-                if not re.search(match_title, title, re.IGNORECASE):
-                    return True, "título não bate regex"
-            except re.error:
-                logger.warning("Regex inválido fornecido para --match-title; ignorando regex e usando substring.")
-                if match_title.lower() not in title.lower():
-                    return True, "título não contém substring"
-        else:
-            if match_title.lower() not in title.lower():
-                return True, "título não contém substring"
+        title = entry.get("title", "")
+        if isinstance(match_title, re.Pattern):
+            if not match_title.search(title):
+                return True, "título não bate regex"
+        elif match_title not in title.lower():
+            return True, "título não contém substring"
 
     return False, "ok"
 
@@ -210,27 +575,113 @@ def download_with_retries(url, ydl_opts, retries=3, backoff=3):
     attempt = 0
     last_exc = None
     while attempt < retries:
+        if shutdown_evt.is_set():
+            return False
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            get_ydl(ydl_opts).download([url])
             return True
         except Exception as e:
+            if shutdown_evt.is_set():
+                return False
             last_exc = e
             attempt += 1
-            wait = backoff * attempt
-            logger.warning(f"Falha no download (tentativa {attempt}/{retries}) para {url}: {e}. Retry em {wait}s")
-            time.sleep(wait)
+            if attempt >= retries:
+                break
+            # backoff exponencial com jitter: workers que falham juntos (ex.: rate limit) não
+            # tentam de novo em sincronia
+            wait = backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"Falha no download (tentativa {attempt}/{retries}) para {url}: {e}. Retry em {wait:.1f}s")
+            # Event.wait em vez de time.sleep: o Ctrl+C acorda a thread na hora
+            if shutdown_evt.wait(timeout=wait):
+                return False
     logger.error(f"Todas as tentativas falharam para {url}. Último erro: {last_exc}")
     return False
 
 
+def handle_sigint(signum, frame):
+    # avisa os workers e mantém o comportamento padrão (KeyboardInterrupt na thread principal)
+    shutdown_evt.set()
+    raise KeyboardInterrupt
+
+
+def install_sigint_handler():
+    signal.signal(signal.SIGINT, handle_sigint)
+
+
 # ---------------- Playlist / flow ----------------
 
+def entry_url_for(entry):
+    return entry.get('webpage_url') or entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
+
+
+def hydrate_entries(entries, info_opts, args, cache_ttl):
+    # Entradas "flat" da playlist costumam vir sem duration/upload_date; buscamos os metadados
+    # completos em paralelo. É trabalho de rede, por isso usa mais threads que os downloads.
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def fetch(entry):
+        # tarefas ainda na fila viram no-op após Ctrl+C
+        if shutdown_evt.is_set():
+            return None
+        return cached_extract_info(entry_url_for(entry), info_opts,
+                                   ttl=cache_ttl, refresh=args.refresh_cache, process=False)
+
+    workers = args.metadata_workers or max(1, args.parallel) * 4
+    hydrated = list(entries)
+    exe = ThreadPoolExecutor(max_workers=workers)
+    completed = False
+    try:
+        futures = {exe.submit(fetch, entry): i for i, entry in enumerate(entries)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                info = fut.result()
+                if info:
+                    hydrated[i] = {**entries[i], **info}
+            except Exception as e:
+                # qualquer falha (inclusive bug de extractor que o yt-dlp não embrulha em ExtractorError)
+                # mantém a entrada flat; os filtros ignoram campos ausentes
+                logger.warning(f"Metadados incompletos para {entries[i].get('title') or entries[i].get('id')}: {e}")
+        completed = True
+    finally:
+        # Ctrl+C: não espera a fila inteira de extract_info, descarta o que não começou e sai
+        exe.shutdown(wait=completed, cancel_futures=not completed)
+    return hydrated
+
+
+def filter_entries(entries, filters, downloaded_ids, ids_on_disk, names_on_disk, preserve_filename):
+    # Checagens baratas primeiro: ids repetidos e o DB (lookup em set) antes de qualquer outro filtro
+    kept = []
+    seen = set()
+    for entry in entries:
+        # Some playlist entries might be None or missing id
+        if not entry:
+            continue
+        vid = entry.get("id")
+        if vid:
+            if vid in seen:
+                # o mesmo vídeo duas vezes na playlist geraria dois downloads no mesmo arquivo
+                logger.info(f"Pulando {entry.get('title') or vid} — id repetido na playlist")
+                continue
+            seen.add(vid)
+        skip, reason = should_skip_entry(entry, filters, downloaded_ids, ids_on_disk, names_on_disk, preserve_filename)
+        if skip:
+            logger.info(f"Pulando {entry.get('title') or entry.get('id')} — {reason}")
+            continue
+        kept.append(entry)
+    return kept
+
+
 def process_playlist(url, dest, args):
-    # Extrai info da playlist
-    ydl_info = yt_dlp.YoutubeDL({'quiet': True, 'nocheckcertificate': True, 'ffmpeg_location': FFMPEG_PATH if FFMPEG_PATH else None})
+    # Extrai info da playlist (ou reaproveita do cache em disco).
+    # extract_flat='in_playlist' mantém essa primeira busca barata: só id/título/duração de cada item,
+    # sem resolver os formatos de cada vídeo antes de sabermos quais passam pelos filtros.
+    info_opts = {'quiet': True, 'nocheckcertificate': True, 'ffmpeg_location': FFMPEG_PATH if FFMPEG_PATH else None,
+                 'logger': ydl_logger}
+    cache_ttl = 0 if args.no_cache else args.cache_ttl
     try:
-        info = ydl_info.extract_info(url, download=False)
+        info = cached_extract_info(url, {**info_opts, 'extract_flat': 'in_playlist', 'skip_download': True},
+                                   ttl=cache_ttl, refresh=args.refresh_cache)
     except Exception as e:
         logger.error(f"Erro ao extrair informações da URL: {e}")
         return
@@ -246,35 +697,80 @@ def process_playlist(url, dest, args):
     logger.info(f"Encontrados {len(entries)} entradas na lista.")
 
     # Carrega DB
-    db_path = os.path.join(dest, DB_FILENAME)
-    downloaded_ids = load_db(db_path)
+    # Carregado uma única vez; o mesmo set é compartilhado (por referência) com os workers
+    db = DownloadDB(os.path.join(dest, DB_FILENAME), legacy_path=os.path.join(dest, LEGACY_DB_FILENAME))
+    atexit.register(db.close)  # garante o fechamento do sqlite mesmo se o processo for interrompido
+    downloaded_ids = db.load()
 
     filters = {
         'min_duration': args.min_duration,
         'max_duration': args.max_duration,
         'date_from': args.date_from,
         'date_to': args.date_to,
-        'match_title': args.match_title,
-        'match_regex': args.match_regex,
+        'match_title': compile_title_filter(args.match_title, args.match_regex),
         'skip_downloaded': args.skip_downloaded,
     }
+    ids_on_disk, names_on_disk = index_existing_files(dest, only_ext=".mp3" if args.convert_mp3 else None)
+
+    # Fase 1: filtra com os dados flat (campos ausentes não eliminam a entrada) e só então
+    # completa, em paralelo, os metadados das entradas que sobraram
+    entries = filter_entries(entries, filters, downloaded_ids, ids_on_disk, names_on_disk, args.preserve_filename)
+    # Só vale a pena completar quem não tem um campo exigido por algum filtro ativo;
+    # sem filtro de duração/data nenhuma requisição extra é feita (o download extrai de novo).
+    needed = []
+    if filters['min_duration'] or filters['max_duration']:
+        needed.append('duration')
+    if filters['date_from'] or filters['date_to']:
+        needed.append('upload_date')
+    missing = [e for e in entries if any(e.get(k) is None for k in needed)]
+    if info.get('entries') and missing:
+        # hydrate_entries preserva a ordem, então dá para casar pelo objeto original
+        hydrated = {id(e): h for e, h in zip(missing, hydrate_entries(missing, info_opts, args, cache_ttl))}
+        entries = [hydrated.get(id(e), e) for e in entries]
+        # reaplica os filtros agora que duration/upload_date estão disponíveis
+        entries = filter_entries(entries, filters, downloaded_ids, ids_on_disk, names_on_disk, args.preserve_filename)
+
+    start_progress_printer()
+
+    # Conversões MP3 rodam em processos separados, sem bloquear os downloads. O pool acompanha
+    # --parallel (as conversões chegam no ritmo dos downloads) e os núcleos restantes são divididos
+    # entre os ffmpeg simultâneos (-threads).
+    # 'spawn' em todas as plataformas: fazer fork com as threads de download/log/progresso rodando
+    # pode herdar locks travados no processo filho.
+    cpu_count = os.cpu_count() or 1
+    encode_workers = max(1, min(cpu_count, args.parallel))
+    encode_exe = None
+    if args.convert_mp3:
+        from concurrent.futures import ProcessPoolExecutor
+
+        encode_exe = ProcessPoolExecutor(max_workers=encode_workers, mp_context=mp.get_context("spawn"),
+                                         initializer=install_sigint_handler)
+    encode_futures = {}
+    post_hooks = None
+    if encode_exe:
+        ffmpeg_threads = max(1, cpu_count // encode_workers)
+        post_hooks = [make_mp3_post_hook(encode_exe, encode_futures, resolve_ffmpeg_binary(FFMPEG_PATH), threads=ffmpeg_threads)]
+    try:
+        download_entries(entries, dest, args, downloaded_ids, db, post_hooks)
+        # só retorna depois que todas as conversões pendentes terminarem
+        wait_for_conversions(encode_futures)
+    finally:
+        if encode_exe:
+            # Ctrl+C: descarta as conversões que ainda não começaram em vez de esperar a fila inteira
+            # (on_converted ignora futures cancelados, então esses ids não vão para o DB)
+            encode_exe.shutdown(wait=True, cancel_futures=shutdown_evt.is_set())
+        db.close()
+
+
+def download_entries(entries, dest, args, downloaded_ids, db, post_hooks=None):
+    # Fase 2: envia os downloads das entradas que passaram pelos filtros
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
-    tasks = []
     with ThreadPoolExecutor(max_workers=args.parallel) as exe:
         futures = {}
         for entry in entries:
-            # Some playlist entries might be None or missing id
-            if not entry:
-                continue
-            # Each entry may not have complete metadata until ydl.extract_info(entry_url) is called.
-            # However many fields are present in playlist entries already.
-            skip, reason = should_skip_entry(entry, filters, downloaded_ids, dest, args.preserve_filename)
-            if skip:
-                logger.info(f"Pulando {entry.get('title') or entry.get('id')} — {reason}")
-                continue
-
             # Determine URL for the entry
-            entry_url = entry.get('webpage_url') or entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
+            entry_url = entry_url_for(entry)
 
             # Prepare outtmpl
             if args.preserve_filename:
@@ -282,10 +778,10 @@ def process_playlist(url, dest, args):
             else:
                 outtmpl = os.path.join(dest, '%(title)s [%(id)s].%(ext)s')
 
-            ydl_opts = build_ydl_opts(outtmpl, args.format, FFMPEG_PATH, convert_mp3=args.convert_mp3, quiet=False, continuedl=True)
+            ydl_opts = build_ydl_opts(outtmpl, args.format, FFMPEG_PATH, convert_mp3=args.convert_mp3, quiet=False, continuedl=True, post_hooks=post_hooks)
 
             # Submit task
-            futures[exe.submit(worker_download_entry, entry_url, entry.get('id'), ydl_opts, db_path, args)] = entry
+            futures[exe.submit(worker_download_entry, entry_url, entry.get('id'), ydl_opts, db, downloaded_ids, args)] = entry
 
         # Wait for completion and report
         for fut in as_completed(futures):
@@ -300,20 +796,36 @@ def process_playlist(url, dest, args):
                 logger.exception(f"Erro inesperado processando {entry.get('title') or entry.get('id')}: {e}")
 
 
-def worker_download_entry(entry_url, entry_id, ydl_opts, db_path, args):
-    # efetua download com retries e atualiza DB
+def record_downloaded(db, downloaded_ids, entry_id):
+    db.add(entry_id)
+    downloaded_ids.add(entry_id)
+
+
+def worker_download_entry(entry_url, entry_id, ydl_opts, db, downloaded_ids, args):
+    # efetua download com retries e atualiza DB (sem recarregá-lo: só grava o novo id)
+    pop_queued_conversion()  # descarta sobra de uma entrada anterior nesta thread
     success = download_with_retries(entry_url, ydl_opts, retries=args.retries, backoff=args.backoff)
+    if not success and entry_id:
+        clear_progress_row(entry_id)
+    conversion = pop_queued_conversion()
     if success and entry_id:
-        with db_lock:
-            ids = load_db(db_path)
-            ids.add(entry_id)
-            save_db(db_path, ids)
+        if conversion is None:
+            record_downloaded(db, downloaded_ids, entry_id)
+        else:
+            # com --convert-mp3 o id só vai para o DB se a conversão der certo; se falhar, a próxima
+            # execução tenta de novo. O callback roda antes de encode_exe.shutdown() retornar,
+            # portanto antes do db.close() em process_playlist.
+            def on_converted(fut):
+                if not fut.cancelled() and fut.exception() is None:
+                    record_downloaded(db, downloaded_ids, entry_id)
+            conversion.add_done_callback(on_converted)
     return success
 
 
 # ----------------- CLI / interface -----------------
 
 def interactive_flow():
+    install_sigint_handler()
     print("Modo interativo ativado.")
     url = input("Cole a URL do vídeo/playlist: ").strip()
     if not url:
@@ -360,6 +872,10 @@ def interactive_flow():
         parallel=1,
         retries=3,
         backoff=3,
+        no_cache=False,
+        refresh_cache=False,
+        cache_ttl=CACHE_TTL,
+        metadata_workers=None,
     )
 
     process_playlist(parser_args.url, parser_args.dest, parser_args)
@@ -380,8 +896,13 @@ def build_arg_parser():
     p.add_argument("--match-regex", action='store_true', help="Interpreta --match-title como regex")
     p.add_argument("--skip-downloaded", action='store_true', default=True, help="Pular vídeos já registrados no DB")
     p.add_argument("--parallel", type=int, default=1, help="Número de downloads simultâneos (cuidado com limites)")
+    p.add_argument("--metadata-workers", type=int, default=None, help="Threads para buscar metadados da playlist (padrão: 4x --parallel)")
     p.add_argument("--retries", type=int, default=3, help="Tentativas de retry por vídeo")
     p.add_argument("--backoff", type=int, default=3, help="Backoff base (segundos) entre retries)")
+    p.add_argument("--cache-ttl", type=int, default=CACHE_TTL, help="Validade (segundos) do cache de metadados")
+    p.add_argument("--no-cache", action='store_true', help="Não usar nem gravar o cache de metadados")
+    p.add_argument("--clear-cache", action='store_true', help="Apaga todo o cache de metadados (pode ser usado sem URL)")
+    p.add_argument("--refresh-cache", action='store_true', help="Ignora o cache existente e extrai os metadados novamente")
     p.add_argument("--quiet", action='store_true', help="Modo silencioso")
     p.add_argument("--interactive", action='store_true', help="Modo interativo")
     return p
@@ -390,6 +911,12 @@ def build_arg_parser():
 def main():
     parser = build_arg_parser()
     args = parser.parse_args()
+    install_sigint_handler()
+
+    if args.clear_cache:
+        clear_metadata_cache()
+        if not args.url and not args.interactive:
+            return
 
     if args.interactive:
         return interactive_flow()